@@ -1,15 +1,27 @@
 import os
+import time
+import hashlib
 import logging
+import threading
+from operator import itemgetter
+from typing import TypedDict
 import jwt
+import httpx
+import ahocorasick
+import redis.asyncio as redis
+from cachetools import LRUCache, TTLCache, cachedmethod
 from dotenv import load_dotenv
 from fastapi import FastAPI, HTTPException, Depends
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel
 from supabase import create_client, Client
+from postgrest.utils import SyncClient
 from langgraph.graph import StateGraph, END
+from langgraph.types import StreamWriter
 from langchain_core.messages import SystemMessage, HumanMessage
 from langchain_groq import ChatGroq
-from IPython.display import Image, display
 
 # Load environment variables
 load_dotenv()
@@ -21,8 +33,21 @@ logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(
 class Config:
     SUPABASE_URL = os.getenv("SUPABASE_URL")
     SUPABASE_KEY = os.getenv("SUPABASE_KEY")
+    SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
     GROQ_API_KEY = os.getenv("GROQ_API_KEY")
     MODEL_NAME = "Gemma2-9b-It"
+    DB_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("DB_MAX_KEEPALIVE_CONNECTIONS", "20"))
+    DB_MAX_CONNECTIONS = int(os.getenv("DB_MAX_CONNECTIONS", "40"))
+    CATEGORY_CACHE_TTL = int(os.getenv("CATEGORY_CACHE_TTL", "300"))
+    LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "2048"))
+    LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", "600"))
+    MAX_FILTER_ITEMS = int(os.getenv("MAX_FILTER_ITEMS", "50"))
+    REDIS_URL = os.getenv("REDIS_URL")
+    RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "600"))
+    REDIS_TIMEOUT = float(os.getenv("REDIS_TIMEOUT", "0.5"))
+    STATE_CACHE_SIZE = int(os.getenv("STATE_CACHE_SIZE", "1000"))
+    STATE_CACHE_TTL = int(os.getenv("STATE_CACHE_TTL", "3600"))
+    JWKS_REFRESH_INTERVAL = int(os.getenv("JWKS_REFRESH_INTERVAL", "60"))
 
     if not SUPABASE_URL or not SUPABASE_KEY or not GROQ_API_KEY:
         raise ValueError("Missing required environment variables.")
@@ -33,43 +58,101 @@ class Database:
     def __init__(self):
         try:
             self.client: Client = create_client(Config.SUPABASE_URL, Config.SUPABASE_KEY)
+            self._configure_connection_pool()
             logging.info("Successfully connected to Supabase.")
         except Exception as e:
             logging.error(f"Database connection error: {str(e)}")
             raise
+        self._categories_cache = TTLCache(maxsize=1, ttl=Config.CATEGORY_CACHE_TTL)
+        self._categories_lock = threading.Lock()
+        self._automaton_cache = LRUCache(maxsize=1)
+        self._automaton_lock = threading.Lock()
 
+    def _configure_connection_pool(self):
+        """Swap the PostgREST session for a keep-alive HTTP/2 pool sized for concurrent requests."""
+        # Only safe because this client never signs users in: supabase-py rebuilds postgrest on auth events
+        session = self.client.postgrest.session
+        self.client.postgrest.session = SyncClient(
+            base_url=session.base_url,
+            headers=session.headers,
+            timeout=session.timeout,
+            follow_redirects=True,
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=Config.DB_MAX_KEEPALIVE_CONNECTIONS, max_connections=Config.DB_MAX_CONNECTIONS))
+        session.close()
+
+    @cachedmethod(lambda self: self._categories_cache, lock=lambda self: self._categories_lock)
     def get_available_categories(self):
-        """Fetch distinct categories from the documents tablein supabase."""
+        """Fetch distinct categories from the documents table via the distinct_genres function in supabase."""
         try:
-            response = self.client.table("documents").select("genre").execute()
-            return list({item["genre"].lower() for item in response.data} if response.data else [])
+            response = self.client.rpc("distinct_genres").execute()
+            return [item["genre"] for item in response.data] if response.data else []
         except Exception as e:
             logging.error(f"Error fetching categories: {str(e)}")
             raise HTTPException(status_code=500, detail="Error fetching categories.")
 
+    @cachedmethod(lambda self: self._automaton_cache, lock=lambda self: self._automaton_lock)
+    def _category_automaton(self, categories):
+        """Build an Aho-Corasick automaton over the given categories, reused until they change."""
+        automaton = ahocorasick.Automaton()
+        for category in categories:
+            automaton.add_word(category, category)
+        automaton.make_automaton()
+        return automaton
+
+    def match_categories(self, text):
+        """Return the available categories mentioned in text as whole words, including multi-word genres.
+
+        Hyphens count as part of a word, so "non-fiction" does not select "fiction", and where matches
+        overlap only the longest is kept, so "science fiction" does not also select "fiction".
+        """
+        categories = tuple(self.get_available_categories())
+        if not categories:
+            return []
+        text = text.lower()
+        is_word_char = lambda char: char.isalnum() or char == "-"
+        candidates = []
+        for end, category in self._category_automaton(categories).iter(text):
+            start = end - len(category) + 1
+            if (start == 0 or not is_word_char(text[start - 1])) and (end + 1 == len(text) or not is_word_char(text[end + 1])):
+                candidates.append((start, end, category))
+        matched = set()
+        taken = []
+        for start, end, category in sorted(candidates, key=lambda match: (match[0] - match[1], match[0])):
+            if all(end < taken_start or start > taken_end for taken_start, taken_end in taken):
+                taken.append((start, end))
+                matched.add(category)
+        return list(matched)
+
     def query_documents(self, genres):
-        """Retrieve documents based on user-selected genres."""
-        all_data = []
+        """Retrieve documents based on user-selected genres in a single query."""
+        if not genres:
+            return []
         try:
-            for genre in genres:
-                docs = self.client.table("documents").select("*").filter("genre", "ilike", genre).execute()
-                if docs.data:
-                    all_data.extend(docs.data)
-            return all_data
+            # Stored genres are mixed case while categories are lowercased, so match with ilike
+            genre_filter = ",".join(f'genre.ilike."{genre}"' for genre in genres)
+            docs = self.client.table("documents").select("*").or_(genre_filter).execute()
+            return docs.data or []
         except Exception as e:
             logging.error(f"Database query error: {str(e)}")
             raise HTTPException(status_code=500, detail="Database query error.")
 
 
 class AuthService:
-    def __init__(self, db_client):
-        self.client = db_client.auth
+    def __init__(self):
+        # A dedicated client, so user sign-ins never touch the data client's session or pooled postgrest
+        self.client = create_client(Config.SUPABASE_URL, Config.SUPABASE_KEY).auth
 
     def register(self, email, password):
         try:
-            response = self.client.sign_up({"email": email, "password": password})
-            return {"message": "User registered successfully!", "data": response}
+            response = self.client.sign_up({
+                "email": email,
+                "password": password,
+                "options": {"email_redirect_to": "http://localhost:8000/confirm"}
+            })
+            return {"message": "User registered successfully! Please check your email for confirmation.", "data": response}
         except Exception as e:
+            logging.error(f"Registration error: {str(e)}")
             raise HTTPException(status_code=400, detail=str(e))
 
     def login(self, email, password):
@@ -86,37 +169,179 @@ class AuthService:
 
 class TokenService:
     security = HTTPBearer()
+    token_cache = TTLCache(maxsize=10000, ttl=30)
+    token_cache_lock = threading.Lock()
+    # The fetched JWK set is reused for lifespan seconds
+    jwks_client = jwt.PyJWKClient(f"{Config.SUPABASE_URL}/auth/v1/.well-known/jwks.json", lifespan=300)
+    jwks_refreshed_at = 0.0
+    jwks_refresh_lock = threading.Lock()
+    asymmetric_algorithms = ["RS256", "ES256"]
+
+    @staticmethod
+    def _jwks_key(kid):
+        """Look up a signing key by kid, refetching the JWK set for an unknown kid at most once per JWKS_REFRESH_INTERVAL."""
+        signing_key = TokenService.jwks_client.match_kid(TokenService.jwks_client.get_signing_keys(), kid)
+        if signing_key is None:
+            # Unknown kids come from rotation but also from forged tokens, so they must not force a fetch per request
+            with TokenService.jwks_refresh_lock:
+                now = time.monotonic()
+                refresh = now - TokenService.jwks_refreshed_at >= Config.JWKS_REFRESH_INTERVAL
+                if refresh:
+                    TokenService.jwks_refreshed_at = now
+            if refresh:
+                signing_key = TokenService.jwks_client.match_kid(TokenService.jwks_client.get_signing_keys(refresh=True), kid)
+        if signing_key is None:
+            raise jwt.PyJWKClientError(f'Unable to find a signing key that matches: "{kid}"')
+        return signing_key.key
+
+    @staticmethod
+    def _signing_key(token):
+        """Resolve the verification key and allowed algorithms for a token."""
+        header = jwt.get_unverified_header(token)
+        # Projects still on the legacy shared secret issue HS256 tokens that are not published in the JWKS
+        if Config.SUPABASE_JWT_SECRET and header.get("alg") == "HS256":
+            return Config.SUPABASE_JWT_SECRET, ["HS256"]
+        # Reject anything the JWKS path could not verify before it can reach the network
+        if header.get("alg") not in TokenService.asymmetric_algorithms or not header.get("kid"):
+            raise jwt.InvalidAlgorithmError("Unsupported token algorithm or missing kid")
+        return TokenService._jwks_key(header["kid"]), TokenService.asymmetric_algorithms
 
     @staticmethod
     def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
         token = credentials.credentials
+        key = hashlib.sha256(token.encode()).digest()[:16]
+        with TokenService.token_cache_lock:
+            payload = TokenService.token_cache.get(key)
+        # A cached entry must not outlive the token itself
+        if payload is not None and payload.get("exp", 0) > time.time():
+            return payload
         try:
-            return jwt.decode(token, options={"verify_signature": False})
+            signing_key, algorithms = TokenService._signing_key(token)
+            payload = jwt.decode(token, signing_key, algorithms=algorithms, audience="authenticated")
+            with TokenService.token_cache_lock:
+                TokenService.token_cache[key] = payload
+            return payload
         except jwt.ExpiredSignatureError:
             raise HTTPException(status_code=401, detail="Token expired")
-        except jwt.InvalidTokenError:
+        except jwt.PyJWKClientConnectionError as e:
+            logging.error(f"JWKS fetch error: {str(e)}")
+            raise HTTPException(status_code=503, detail="Unable to fetch token signing keys")
+        except (jwt.InvalidTokenError, jwt.PyJWKClientError):
             raise HTTPException(status_code=401, detail="Invalid token")
 
 # LLM service
 class LLMService:
     def __init__(self):
         self.llm = ChatGroq(groq_api_key=Config.GROQ_API_KEY, model_name=Config.MODEL_NAME)
+        self.response_cache = TTLCache(maxsize=Config.LLM_CACHE_SIZE, ttl=Config.LLM_CACHE_TTL)
+        self.response_cache_lock = threading.Lock()
+
+    @staticmethod
+    def _cache_key(system_prompt, user_input):
+        return hashlib.blake2b(f"{system_prompt}\x00{user_input}".encode()).hexdigest()
+
+    def _get_cached(self, key):
+        with self.response_cache_lock:
+            return self.response_cache.get(key)
 
-    def get_response(self, system_prompt, user_input):
+    def _set_cached(self, key, content):
+        with self.response_cache_lock:
+            self.response_cache[key] = content
+
+    async def aget_response(self, system_prompt, user_input):
+        key = self._cache_key(system_prompt, user_input)
+        cached = self._get_cached(key)
+        if cached is not None:
+            return cached
+        try:
+            response = await self.llm.ainvoke([SystemMessage(content=system_prompt), HumanMessage(content=user_input)])
+            content = response.content if hasattr(response, "content") else response
+            self._set_cached(key, content)
+            return content
+        except Exception as e:
+            logging.error(f"LLM error: {str(e)}")
+            raise HTTPException(status_code=500, detail="LLM processing error.")
+
+    async def astream(self, system_prompt, user_input):
+        """Yield the response content chunk by chunk as tokens arrive."""
+        key = self._cache_key(system_prompt, user_input)
+        cached = self._get_cached(key)
+        if cached is not None:
+            yield cached
+            return
+        chunks = []
         try:
-            response = self.llm.invoke([SystemMessage(content=system_prompt), HumanMessage(content=user_input)])
-            return response.content if hasattr(response, "content") else response
+            async for chunk in self.llm.astream([SystemMessage(content=system_prompt), HumanMessage(content=user_input)]):
+                if chunk.content:
+                    chunks.append(chunk.content)
+                    yield chunk.content
         except Exception as e:
             logging.error(f"LLM error: {str(e)}")
             raise HTTPException(status_code=500, detail="LLM processing error.")
+        # An empty completion would otherwise be served for every identical prompt until it expires
+        if chunks:
+            self._set_cached(key, "".join(chunks))
+
+# Response cache
+class ResponseCache:
+    """Redis-backed cache of final recommendation responses; disabled when REDIS_URL is not set."""
+
+    def __init__(self):
+        # Short timeouts so an unreachable Redis costs a fraction of a second, not the OS TCP connect timeout
+        self.client = redis.from_url(Config.REDIS_URL, socket_connect_timeout=Config.REDIS_TIMEOUT, socket_timeout=Config.REDIS_TIMEOUT) if Config.REDIS_URL else None
+
+    @staticmethod
+    def _key(user_input):
+        normalized = " ".join(user_input.lower().split())
+        return "rec:" + hashlib.blake2b(normalized.encode()).hexdigest()
+
+    async def get(self, user_input):
+        if self.client is None:
+            return None
+        try:
+            cached = await self.client.get(self._key(user_input))
+            return cached.decode() if cached is not None else None
+        except Exception as e:
+            logging.error(f"Response cache read error: {str(e)}")
+            return None
+
+    async def set(self, user_input, response):
+        if self.client is None:
+            return
+        try:
+            await self.client.set(self._key(user_input), response.encode(), ex=Config.RESPONSE_CACHE_TTL)
+        except Exception as e:
+            logging.error(f"Response cache write error: {str(e)}")
+
+# Workflow state
+class RecommendationState(TypedDict):
+    user_input: str
+    user_preferences: str
+    retrieved_items: list
+    filtered_recommendations: str
+    final_response: str
+
+# Workflow routing
+def route_after_user_interaction(state):
+    return "Retrieval" if state["user_preferences"] else "Final Response"
+
+def route_after_retrieval(state):
+    return "Filtering" if state["retrieved_items"] else "Final Response"
 
 # Recommendation workflow
 class RecommendationWorkflow:
+    NO_RECOMMENDATIONS = "No recommendations found"
+    STREAM_INTERRUPTED = "Recommendations were interrupted. Please try again."
+
     def __init__(self, llm_service, db_service):
         self.llm = llm_service
         self.db = db_service
-        self.workflow = StateGraph(dict)
+        self.workflow = StateGraph(RecommendationState)
         self._build_workflow()
+        self.compiled_graph = self.workflow.compile()
+        # Each user's latest final state, so /get_state can read it back without re-running the graph
+        self.latest_states = TTLCache(maxsize=Config.STATE_CACHE_SIZE, ttl=Config.STATE_CACHE_TTL)
+        self._graph_image_path = None
     
     def _build_workflow(self):
         self.workflow.add_node("User Interaction", self.user_interaction_agent)
@@ -126,11 +351,11 @@ class RecommendationWorkflow:
         self.workflow.set_entry_point("User Interaction")
         self.workflow.add_conditional_edges(
              "User Interaction",
-             lambda state: "Retrieval" if state["user_preferences"] else "Final Response",
+             route_after_user_interaction,
             {"Retrieval": "Retrieval","Final Response": "Final Response"})
         self.workflow.add_conditional_edges(
              "Retrieval",
-             lambda state: "Filtering" if state["retrieved_items"] else "Final Response",
+             route_after_retrieval,
              {"Filtering": "Filtering","Final Response": "Final Response"})
         self.workflow.add_edge("Filtering", "Final Response")
         self.workflow.add_edge("Final Response", END)
@@ -138,71 +363,127 @@ class RecommendationWorkflow:
     def visualize_graph(self):
         """Generate and display the workflow graph."""
         try:
-            img_data = self.workflow.compile().get_graph().draw_mermaid_png()
-            with open("graph_image.png", "wb") as f:
-                f.write(img_data)
-            display(Image(filename="graph_image.png"))
+            from IPython.display import Image, display
+            if self._graph_image_path is None:
+                graph = self.compiled_graph.get_graph()
+                # Name the image after the graph definition so a changed workflow is never served stale
+                digest = hashlib.blake2b(graph.draw_mermaid().encode(), digest_size=8).hexdigest()
+                path = f"graph_image_{digest}.png"
+                if not os.path.exists(path):
+                    with open(path, "wb") as f:
+                        f.write(graph.draw_mermaid_png())
+                self._graph_image_path = path
+            display(Image(filename=self._graph_image_path))
             logging.info("Workflow visualization generated successfully.")
         except Exception as e:
             logging.error(f"Error visualizing workflow: {e}")
     
-    def user_interaction_agent(self, state):
+    async def user_interaction_agent(self, state):
         """Collect user preferences."""
         system_prompt = """You are a friendly and helpful assistant. Your ONLY job is to collect user preferences for movies and books. Return the preferences in a clear, concise sentence.  For example: "The user likes sci-fi movies and fantasy books."  Do not provide recommendations yet. Just collect preferences."""
         try:
-            state["user_preferences"] = self.llm.get_response(system_prompt, state["user_input"])
-            logging.info(f"User preferences collected: {state['user_preferences']}")
+            user_preferences = await self.llm.aget_response(system_prompt, state["user_input"])
+            logging.info(f"User preferences collected: {user_preferences}")
+            return {"user_preferences": user_preferences}
         except Exception as e:
             logging.error(f"Error in user interaction agent: {e}")
-        return state
+        return {}
     
-    def retrieval_agent(self, state):
+    async def retrieval_agent(self, state):
         """Retrieve relevant documents based on user preferences."""
+        if not state["user_preferences"].strip():
+            return {"retrieved_items": []}
         try:
-            available_categories = self.db.get_available_categories()
-            user_preferences = set(state["user_preferences"].lower().split())
-            selected_categories = [category for category in available_categories if category in user_preferences]
-            state["retrieved_items"] = self.db.query_documents(selected_categories) if selected_categories else []
-            logging.info(f"Retrieved items: {state['retrieved_items']}")
+            selected_categories = await run_in_threadpool(self.db.match_categories, state["user_preferences"])
+            if not selected_categories:
+                logging.info("No categories matched user preferences; skipping document query.")
+                return {"retrieved_items": []}
+            retrieved_items = await run_in_threadpool(self.db.query_documents, selected_categories)
+            logging.info(f"Retrieved items: {retrieved_items}")
+            return {"retrieved_items": retrieved_items}
         except Exception as e:
             logging.error(f"Error in retrieval agent: {e}")
-        return state
+        return {"retrieved_items": []}
 
     
-    def filtering_agent(self, state):
-        """Filter retrieved items based on user preferences."""
+    async def filtering_agent(self, state, writer: StreamWriter):
+        """Filter retrieved items based on user preferences, streaming formatted lines to the writer as they complete."""
         user_prefs = state.get("user_preferences", "")
-        system_prompt = """You are a helpful assistant that filters recommendations based on user preferences.
-                            Return only the recommendations that closely match the user's expressed interests.
-                            If no recommendations match the user preferences, return "No recommendations found"."""
-        formatted_items = "\n".join([f"Title: {item['title']}, Author: {item['author']}, Director: {item['director']}, Genre: {item['genre']}" for item in state["retrieved_items"]])
+        system_prompt = f"""You are a helpful assistant that filters recommendations based on user preferences.
+                            Return only the recommendations that closely match the user's expressed interests, one per line, as "Title by Author/Director".
+                            Do not add any other text.
+                            If no recommendations match the user preferences, return "{self.NO_RECOMMENDATIONS}"."""
+        # Cap the items sent to the LLM; prompt length drives both token cost and time to first token
+        item_fields = itemgetter("title", "author", "director", "genre")
+        items = state["retrieved_items"][:Config.MAX_FILTER_ITEMS]
+        formatted_items = "\n".join(f"Title: {title}, Author: {author}, Director: {director}, Genre: {genre}" for title, author, director, genre in map(item_fields, items))
+        chunks = []
+        pending = ""
         try:
-            state["filtered_recommendations"] = self.llm.get_response(system_prompt, f"User preferences: {user_prefs}\nItems:\n{formatted_items}")
-            logging.info(f"Filtered recommendations: {state['filtered_recommendations']}")
+            async for chunk in self.llm.astream(system_prompt, f"User preferences: {user_prefs}\nItems:\n{formatted_items}"):
+                chunks.append(chunk)
+                *lines, pending = (pending + chunk).split("\n")
+                for line in filter(None, map(self._format_line, lines)):
+                    writer(line + "\n")
+            if line := self._format_line(pending):
+                writer(line + "\n")
+            filtered_recommendations = "".join(chunks)
+            logging.info(f"Filtered recommendations: {filtered_recommendations}")
+            return {"filtered_recommendations": filtered_recommendations}
         except Exception as e:
             logging.error(f"Error in filtering agent: {e}")
-        return state
-    
-    def final_response_agent(self, state):
-        """Get the final response"""
-        system_prompt = "Format the recommendations in an engaging way.  Include titles and authors/directors where available."
-        try:
-            state["final_response"] = self.llm.get_response(system_prompt, f'Here are the recommendations: {state["filtered_recommendations"]}')
-            logging.info(f"final_response: {state['final_response']}")
-        except Exception as e:
-            logging.error(f"Error in filtering agent: {e}")
-        return state
+        return {}
+
+    def _format_line(self, line):
+        """Format one recommendation line for display, or return None for blank lines."""
+        line = line.strip().lstrip("-*• ").strip()
+        if not line:
+            return None
+        return line if line == self.NO_RECOMMENDATIONS else f"• {line}"
+
+    async def final_response_agent(self, state):
+        """Get the final response by formatting the filtered recommendations, without an LLM call"""
+        lines = [line for line in map(self._format_line, state["filtered_recommendations"].splitlines()) if line]
+        final_response = "\n".join(lines) if lines else self.NO_RECOMMENDATIONS
+        logging.info(f"final_response: {final_response}")
+        return {"final_response": final_response}
     
-    def run(self, user_input):
-        """Get recommendations"""
-        initial_state = {"user_input": user_input, "user_preferences": "", "retrieved_items": [], "filtered_recommendations": "", "final_response": ""}
-        response=self.workflow.compile().invoke(initial_state)
-        return response["final_response"]
+    def _initial_state(self, user_input) -> RecommendationState:
+        return {"user_input": user_input, "user_preferences": "", "retrieved_items": [], "filtered_recommendations": "", "final_response": ""}
+
+    async def astream(self, user_input, user_id, on_complete=None):
+        """Stream the final response as it is generated; await on_complete(final_response) if the run finished cleanly"""
+        initial_state = self._initial_state(user_input)
+        streamed = []
+        final_state = initial_state
+        async for mode, chunk in self.compiled_graph.astream(initial_state, stream_mode=["custom", "values"]):
+            if mode == "custom":
+                streamed.append(chunk)
+                yield chunk
+            else:
+                final_state = chunk
+        # Nothing reached the writer, e.g. no items were retrieved or filtering failed before its first line
+        if not streamed:
+            streamed.append(final_state["final_response"])
+            yield final_state["final_response"]
+        # Filtering failed mid-stream: the client holds a partial list that final_response does not reflect
+        if "".join(streamed).strip() != final_state["final_response"]:
+            self.latest_states.pop(user_id, None)
+            yield f"\n{self.STREAM_INTERRUPTED}\n"
+            return
+        self.latest_states[user_id] = final_state
+        # A failure in an earlier agent leaves filtered_recommendations empty
+        if final_state["filtered_recommendations"] and on_complete is not None:
+            await on_complete(final_state["final_response"])
     
-    def get_state(self, user_input):
-        """Get agent states"""
-        initial_state = {"user_input": user_input, "user_preferences": "", "retrieved_items": [], "filtered_recommendations": "", "final_response": ""}
-        return self.workflow.compile().invoke(initial_state)
+    async def aget_state(self, user_input, user_id):
+        """Get agent states, reusing the user's latest state when that run had the same input"""
+        latest_state = self.latest_states.get(user_id)
+        if latest_state is not None and latest_state["user_input"] == user_input:
+            return latest_state
+        final_state = await self.compiled_graph.ainvoke(self._initial_state(user_input))
+        self.latest_states[user_id] = final_state
+        return final_state
    
 
 
@@ -215,12 +496,18 @@ class RecommendationRequest(BaseModel):
 
 
 # FastAPI application
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 db = Database()
-auth_service = AuthService(db.client)
+auth_service = AuthService()
 token_service = TokenService()
 llm_service = LLMService()
 recommender = RecommendationWorkflow(llm_service, db)
+response_cache = ResponseCache()
+
+
+def get_auth_service() -> AuthService:
+    """Shared AuthService, created once at startup."""
+    return auth_service
 
 # Default end point
 @app.get("/")
@@ -229,38 +516,34 @@ async def root():
 
 # Register end point
 @app.post("/register")
-async def register(user: UserAuth):
-    try:
-        response = db.client.auth.sign_up({
-            "email": user.email,
-            "password": user.password,
-            "options": {"email_redirect_to": "http://localhost:8000/confirm"}
-        })
-        return {"message": "User registered successfully! Please check your email for confirmation.", "data": response}
-    except Exception as e:
-        print("Supabase Error:", str(e))  # Debugging: Print the exact error
-        raise HTTPException(status_code=400, detail=str(e))
+def register(user: UserAuth, auth: AuthService = Depends(get_auth_service)):
+    return auth.register(user.email, user.password)
 
 # Login end point
 @app.post("/login")
-async def login(user: UserAuth):
-    try:
-        response = db.client.auth.sign_in_with_password({"email": user.email, "password": user.password})
-        if response and response.session:
-            return {"access_token": response.session.access_token, "user": response.user}
-        raise HTTPException(status_code=400, detail="Invalid credentials")
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
+def login(user: UserAuth, auth: AuthService = Depends(get_auth_service)):
+    return auth.login(user.email, user.password)
+
+async def stream_and_cache(user_input, user_id):
+    """Stream the workflow response and cache it once the run completes cleanly."""
+    async def cache_response(response):
+        await response_cache.set(user_input, response)
+
+    async for chunk in recommender.astream(user_input, user_id, on_complete=cache_response):
+        yield chunk
 
 # Recommendations end point
 @app.post("/recommend")
 async def recommend(request: RecommendationRequest, user=Depends(token_service.verify_token)):
-    return recommender.run(request.user_input)
+    cached = await response_cache.get(request.user_input)
+    if cached is not None:
+        return PlainTextResponse(cached)
+    return StreamingResponse(stream_and_cache(request.user_input, user["sub"]), media_type="text/plain")
 
 # Get state end point
 @app.post("/get_state")
-async def recommend(request: RecommendationRequest, user=Depends(token_service.verify_token)):
-    return recommender.get_state(request.user_input)
+async def get_state(request: RecommendationRequest, user=Depends(token_service.verify_token)):
+    return await recommender.aget_state(request.user_input, user["sub"])
 
 
 @app.get("/visualize_workflow")
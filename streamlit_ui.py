@@ -1,5 +1,5 @@
 import streamlit as st
-import requests
+import httpx
 import logging
 from dotenv import load_dotenv
 import os
@@ -14,45 +14,51 @@ class Config:
     """Configuration class to store backend URL"""
     BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:8000")
 
+@st.cache_resource
+def api():
+    """Process-wide HTTP client so backend calls reuse one keep-alive connection."""
+    return httpx.Client(base_url=Config.BACKEND_URL, http2=True, timeout=30, limits=httpx.Limits(max_keepalive_connections=10))
+
 def register_user(email: str, password: str):
     """Registers a new user."""
     try:
-        response = requests.post(f"{Config.BACKEND_URL}/register", json={"email": email, "password": password})
+        response = api().post("/register", json={"email": email, "password": password})
         response.raise_for_status()
         return response.json()
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         logging.error(f"Error during registration: {e}")
         return {"error": "Registration failed. Please try again."}
 
 def login_user(email: str, password: str):
     """Logs in an existing user."""
     try:
-        response = requests.post(f"{Config.BACKEND_URL}/login", json={"email": email, "password": password})
+        response = api().post("/login", json={"email": email, "password": password})
         response.raise_for_status()
         return response.json()
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         logging.error(f"Error during login: {e}")
         return {"error": "Login failed. Please check your credentials."}
 
 def get_recommendations(user_input: str, token: str):
-    """Fetches personalized recommendations."""
+    """Streams personalized recommendations as they are generated."""
     try:
         headers = {"Authorization": f"Bearer {token}"}
-        response = requests.post(f"{Config.BACKEND_URL}/recommend", json={"user_input": user_input}, headers=headers)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
+        with api().stream("POST", "/recommend", json={"user_input": user_input}, headers=headers) as response:
+            response.raise_for_status()
+            for chunk in response.iter_text():
+                yield chunk
+    except httpx.HTTPError as e:
         logging.error(f"Error fetching recommendations: {e}")
-        return {"error": "Failed to fetch recommendations."}
+        yield "Failed to fetch recommendations."
 
 def get_agent_states(user_input: str, token: str):
     """Fetches the current state of AI agents."""
     try:
         headers = {"Authorization": f"Bearer {token}"}
-        response = requests.post(f"{Config.BACKEND_URL}/get_state", json={"user_input": user_input}, headers=headers)
+        response = api().post("/get_state", json={"user_input": user_input}, headers=headers)
         response.raise_for_status()
         return response.json()
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         logging.error(f"Error fetching agent states: {e}")
         return {"error": "Failed to fetch agent states."}
 
@@ -91,8 +97,7 @@ def streamlit_ui():
         if st.button("Get Recommendations"):
             token = st.session_state.get("token", "")
             if token:
-                result = get_recommendations(user_input, token)
-                st.write(result)
+                st.write_stream(get_recommendations(user_input, token))
             else:
                 st.error("Please log in first.")
 